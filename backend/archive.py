@@ -0,0 +1,143 @@
+# archive.py
+import os
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from pymongo import ASCENDING, DeleteOne, ReplaceOne
+
+load_dotenv()
+
+# Finished rides older than this many days are moved out of the live collection
+ARCHIVE_AFTER_DAYS = int(os.getenv("RIDE_ARCHIVE_AFTER_DAYS", "30"))
+# How often the background archival job runs
+ARCHIVE_INTERVAL_MINUTES = int(os.getenv("RIDE_ARCHIVE_INTERVAL_MINUTES", "60"))
+# Number of rides moved per round trip to MongoDB
+ARCHIVE_BATCH_SIZE = int(os.getenv("RIDE_ARCHIVE_BATCH_SIZE", "500"))
+
+FINISHED_STATUSES = ["completed", "cancelled"]
+# Fields that can still change after a ride has finished (see rate_ride)
+MUTABLE_FIELDS = ["rating"]
+# Set on an archived copy until its live original is deleted; readers skip these
+# copies so a ride that is mid-archival is only seen once, in the live tier
+PENDING_FIELD = "archive_pending"
+NOT_PENDING = {PENDING_FIELD: {"$ne": True}}
+
+
+def ensure_ride_indexes(rides_collection, archive_collection):
+    """
+    Create the indexes used by the live lookups and the history lookups.
+    Safe to call on every startup, MongoDB skips indexes that already exist.
+    """
+    for collection in (rides_collection, archive_collection):
+        collection.create_index([("rider_email", ASCENDING)])
+        collection.create_index([("driver_id", ASCENDING), ("status", ASCENDING)])
+    rides_collection.create_index([("status", ASCENDING)])
+
+
+def finished_before_query(cutoff):
+    """
+    Query matching completed/cancelled rides that finished before `cutoff`.
+    Rides without a completed_at/cancelled_at timestamp fall back to ride_time,
+    which is stored as an ISO string and therefore compares lexicographically.
+    """
+    return {
+        "status": {"$in": FINISHED_STATUSES},
+        "$or": [
+            {"completed_at": {"$lt": cutoff}},
+            {"cancelled_at": {"$lt": cutoff}},
+            {
+                "completed_at": {"$exists": False},
+                "cancelled_at": {"$exists": False},
+                "ride_time": {"$lt": cutoff.isoformat()},
+            },
+        ],
+    }
+
+
+def archive_finished_rides(rides_collection, archive_collection, max_age_days=None, batch_size=None):
+    """
+    Move finished rides older than `max_age_days` from the live rides collection
+    into the archive collection.
+
+    A ride is only deleted from the live collection if it still matches the
+    snapshot that was copied. A ride changed in between (e.g. rated) stays live
+    and is copied again on the next pass, overwriting the stale archived copy.
+    Copies stay marked as pending until their live original is gone.
+
+    Args:
+        rides_collection: Live (hot) rides collection
+        archive_collection: Archive (cold) rides collection
+        max_age_days: Minimum age of a finished ride before it is archived
+        batch_size: Number of rides moved per batch
+
+    Returns:
+        Number of rides moved to the archive
+    """
+    max_age_days = ARCHIVE_AFTER_DAYS if max_age_days is None else max_age_days
+    batch_size = batch_size or ARCHIVE_BATCH_SIZE
+    cutoff = datetime.utcnow() - timedelta(days=max_age_days)
+    query = finished_before_query(cutoff)
+
+    # Finish copies left pending by a run that stopped before clearing them
+    pending_ids = archive_collection.distinct("_id", {PENDING_FIELD: True})
+    if pending_ids:
+        _clear_pending(rides_collection, archive_collection, pending_ids)
+
+    moved = 0
+    while True:
+        batch = list(rides_collection.find(query).limit(batch_size))
+        if not batch:
+            break
+
+        # Upsert so copies left by an interrupted run, or stale copies of rides
+        # that changed during a previous pass, are overwritten
+        archive_collection.bulk_write(
+            [ReplaceOne({"_id": ride["_id"]}, {**ride, PENDING_FIELD: True}, upsert=True) for ride in batch],
+            ordered=False,
+        )
+
+        # Only delete once every ride in the batch is safely in the archive,
+        # and only if it is unchanged since it was copied
+        deletes = []
+        for ride in batch:
+            snapshot = dict(ride)
+            for field in MUTABLE_FIELDS:
+                snapshot.setdefault(field, None)  # Matches a missing or null field
+            deletes.append(DeleteOne(snapshot))
+        deleted = rides_collection.bulk_write(deletes, ordered=False).deleted_count
+        moved += deleted
+        _clear_pending(rides_collection, archive_collection, [ride["_id"] for ride in batch])
+
+        if deleted == 0:
+            # Every ride in the batch changed underneath us; pick them up next run
+            break
+
+    return moved
+
+
+def _clear_pending(rides_collection, archive_collection, ids):
+    """
+    Unmark archived copies among `ids` whose live original has been deleted
+    """
+    still_live = [ride["_id"] for ride in rides_collection.find({"_id": {"$in": ids}}, {"_id": 1})]
+    archive_collection.update_many(
+        {"_id": {"$in": ids, "$nin": still_live}},
+        {"$unset": {PENDING_FIELD: ""}},
+    )
+
+
+def find_rides(rides_collection, archive_collection, query):
+    """
+    Run `query` against both the live and the archived rides, live rides first.
+    A ride that is mid-archival is only returned from the live tier.
+    """
+    archived = archive_collection.find({"$and": [query, NOT_PENDING]})
+    return list(rides_collection.find(query)) + list(archived)
+
+
+def count_rides(rides_collection, archive_collection, query):
+    """
+    Count rides matching `query` across both tiers, counting rides that are
+    mid-archival once.
+    """
+    archived = archive_collection.count_documents({"$and": [query, NOT_PENDING]})
+    return rides_collection.count_documents(query) + archived
@@ -0,0 +1,260 @@
+# eta.py
+import os
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from dotenv import load_dotenv
+from utils import haversine
+
+load_dotenv()
+
+# Area covered by the zone grid: min_lat,min_lon,max_lat,max_lon (default: Bengaluru)
+ETA_GRID_BOUNDS = [float(x) for x in os.getenv("ETA_GRID_BOUNDS", "12.80,77.40,13.20,77.80").split(",")]
+# Side of a square zone in degrees (0.025 deg is roughly 2.8 km)
+ETA_ZONE_SIZE_DEG = float(os.getenv("ETA_ZONE_SIZE_DEG", "0.025"))
+# Used when the table has no trips for a zone pair, or a point is outside the grid
+ETA_DEFAULT_SPEED_KMPH = float(os.getenv("ETA_DEFAULT_SPEED_KMPH", "25"))
+# Upper bound on zones; the lookup table takes 24 * zones^2 * 4 bytes (400 zones: ~15 MB)
+ETA_MAX_ZONES = int(os.getenv("ETA_MAX_ZONES", "400"))
+# How often new completed rides are folded into the table
+ETA_REFRESH_MINUTES = int(os.getenv("ETA_REFRESH_MINUTES", "15"))
+# Each refresh re-reads rides completed this long before the watermark, so a
+# completion committed late (its completed_at taken before a newer ride's) is not missed
+ETA_REFRESH_OVERLAP_MINUTES = int(os.getenv("ETA_REFRESH_OVERLAP_MINUTES", "10"))
+
+# Trips outside this range are treated as bad data
+MIN_TRIP_SECONDS = 30
+MAX_TRIP_SECONDS = 4 * 60 * 60
+# Epoch values above this are milliseconds (JS Date.now()), not seconds
+MAX_EPOCH_SECONDS = 1e11
+
+
+def _to_utc(value, naive_is_local=False):
+    """
+    Convert a datetime, ISO string or epoch seconds/milliseconds to an aware UTC
+    datetime, or None when the value cannot be read.
+    MongoDB returns naive datetimes in UTC; ride_time is a naive local ISO string.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        if value > MAX_EPOCH_SECONDS:
+            value = value / 1000
+        try:
+            return datetime.fromtimestamp(value, tz=timezone.utc)
+        except (ValueError, OverflowError, OSError):
+            return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        naive_is_local = True
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        # astimezone() treats a naive datetime as local time
+        return value.astimezone(timezone.utc) if naive_is_local else value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _trail_point(point):
+    """
+    Read a GPS trail point stored as {"lat", "lon", "timestamp"} or [lat, lon, timestamp]
+    """
+    if isinstance(point, dict):
+        return point.get("lat"), point.get("lon"), _to_utc(point.get("timestamp"))
+    if isinstance(point, (list, tuple)) and len(point) >= 3:
+        return point[0], point[1], _to_utc(point[2])
+    return None, None, None
+
+
+def trip_from_ride(ride):
+    """
+    Extract (start_lat, start_lon, end_lat, end_lon, start_time, end_time) from a
+    completed ride, preferring its GPS trail when one was stored.
+
+    Without a trail the trip starts at picked_up_at. Older rides only have
+    accepted_at (which adds the driver's drive to the pickup) or ride_time (which
+    also adds the wait for a driver), so those durations overstate the travel time.
+    Returns None when the ride does not carry enough information.
+    """
+    trail = ride.get("gps_trail") or []
+    if len(trail) >= 2:
+        start_lat, start_lon, start_time = _trail_point(trail[0])
+        end_lat, end_lon, end_time = _trail_point(trail[-1])
+    else:
+        pickup, drop = ride.get("pickup_coords"), ride.get("drop_coords")
+        if not pickup or not drop:
+            return None
+        start_lat, start_lon = pickup
+        end_lat, end_lon = drop
+        start_time = (
+            _to_utc(ride.get("picked_up_at"))
+            or _to_utc(ride.get("accepted_at"))
+            or _to_utc(ride.get("ride_time"), naive_is_local=True)
+        )
+        end_time = _to_utc(ride.get("completed_at"))
+
+    if None in (start_lat, start_lon, end_lat, end_lon, start_time, end_time):
+        return None
+    try:
+        start_lat, start_lon, end_lat, end_lon = (float(v) for v in (start_lat, start_lon, end_lat, end_lon))
+    except (TypeError, ValueError):
+        return None
+    return start_lat, start_lon, end_lat, end_lon, start_time, end_time
+
+
+class TravelTimeMatrix:
+    """
+    Average zone-to-zone travel time for each hour of the day, kept in memory as
+    a float32 NumPy array indexed [hour, from_zone, to_zone] so a lookup is O(1).
+    Trip totals are accumulated sparsely; only the cells they touch are rewritten.
+    """
+
+    def __init__(self, bounds=None, zone_size=None, default_speed_kmph=None, max_zones=None):
+        self.min_lat, self.min_lon, self.max_lat, self.max_lon = bounds or ETA_GRID_BOUNDS
+        self.zone_size = zone_size or ETA_ZONE_SIZE_DEG
+        self.default_speed_kmph = default_speed_kmph or ETA_DEFAULT_SPEED_KMPH
+        self.rows = int(np.ceil((self.max_lat - self.min_lat) / self.zone_size))
+        self.cols = int(np.ceil((self.max_lon - self.min_lon) / self.zone_size))
+        self.num_zones = self.rows * self.cols
+
+        max_zones = max_zones or ETA_MAX_ZONES
+        if self.num_zones > max_zones:
+            raise ValueError(
+                f"ETA grid has {self.num_zones} zones ({self.rows}x{self.cols}), more than "
+                f"ETA_MAX_ZONES={max_zones}; use a larger ETA_ZONE_SIZE_DEG or smaller ETA_GRID_BOUNDS"
+            )
+
+        # (hour, from_zone, to_zone) / (from_zone, to_zone) -> [total_seconds, trips]
+        self.hourly_totals = {}
+        self.all_hours_totals = {}
+        # Read by the lookups; NaN where no trips are known
+        self.minutes = np.full((24, self.num_zones, self.num_zones), np.nan, dtype=np.float32)
+        self.all_hours_minutes = np.full((self.num_zones, self.num_zones), np.nan, dtype=np.float32)
+        self.last_completed_at = None  # Watermark for incremental refreshes
+        self.recent_ride_ids = {}  # _id -> completed_at of rides inside the overlap window
+        self.trips_loaded = 0
+        self.rides_skipped = 0
+
+    def zone_of(self, lat, lon):
+        """
+        Index of the zone containing (lat, lon), or None outside the grid
+        """
+        row = int((lat - self.min_lat) // self.zone_size)
+        col = int((lon - self.min_lon) // self.zone_size)
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            return row * self.cols + col
+        return None
+
+    def add_trip(self, start_lat, start_lon, end_lat, end_lon, start_time, end_time):
+        seconds = (end_time - start_time).total_seconds()
+        if not MIN_TRIP_SECONDS <= seconds <= MAX_TRIP_SECONDS:
+            return False
+        from_zone = self.zone_of(start_lat, start_lon)
+        to_zone = self.zone_of(end_lat, end_lon)
+        if from_zone is None or to_zone is None:
+            return False
+
+        hour = start_time.astimezone().hour  # Traffic follows local time of day
+        for totals, cell, minutes in (
+            (self.hourly_totals, (hour, from_zone, to_zone), self.minutes),
+            (self.all_hours_totals, (from_zone, to_zone), self.all_hours_minutes),
+        ):
+            total = totals.setdefault(cell, [0.0, 0])
+            total[0] += seconds
+            total[1] += 1
+            minutes[cell] = total[0] / total[1] / 60
+        self.trips_loaded += 1
+        return True
+
+    def refresh(self, rides_collection, archive_collection=None):
+        """
+        Fold rides completed since the last refresh into the table.
+        The first refresh also reads the archive so history is not lost.
+
+        Rides are de-duplicated by _id, both across the two tiers (a ride can be
+        archived between the two reads) and across the overlap window that each
+        refresh re-reads. A ride that cannot be read is skipped and counted in
+        rides_skipped instead of stopping the refresh.
+
+        Returns:
+            Number of trips added
+        """
+        query = {"status": "completed", "completed_at": {"$exists": True}}
+        collections = [rides_collection]
+        if self.last_completed_at is None:
+            if archive_collection is not None:
+                collections.append(archive_collection)
+        else:
+            overlap = timedelta(minutes=ETA_REFRESH_OVERLAP_MINUTES)
+            query["completed_at"] = {"$gt": self.last_completed_at - overlap}
+
+        added = 0
+        newest = self.last_completed_at
+        seen = set()
+        projection = [
+            "pickup_coords", "drop_coords", "gps_trail",
+            "ride_time", "accepted_at", "picked_up_at", "completed_at",
+        ]
+        for collection in collections:
+            for ride in collection.find(query, projection):
+                ride_id = ride["_id"]
+                if ride_id in seen or ride_id in self.recent_ride_ids:
+                    continue
+                seen.add(ride_id)
+
+                completed_at = ride["completed_at"]
+                if not isinstance(completed_at, datetime):
+                    self.rides_skipped += 1
+                    continue
+                self.recent_ride_ids[ride_id] = completed_at
+                if newest is None or completed_at > newest:
+                    newest = completed_at
+
+                try:
+                    trip = trip_from_ride(ride)
+                    if trip and self.add_trip(*trip):
+                        added += 1
+                except Exception as e:
+                    self.rides_skipped += 1
+                    print(f"Skipping ride {ride_id} in travel-time refresh: {str(e)}")
+
+        # Only move the watermark once the whole pass has been read
+        if newest is not None:
+            self.last_completed_at = newest
+            horizon = newest - timedelta(minutes=ETA_REFRESH_OVERLAP_MINUTES)
+            self.recent_ride_ids = {
+                ride_id: completed_at for ride_id, completed_at in self.recent_ride_ids.items()
+                if completed_at > horizon
+            }
+        return added
+
+    def eta_minutes(self, from_lat, from_lon, to_lat, to_lon, at=None):
+        """
+        Estimated travel time in minutes between two points at time `at` (default: now).
+        Uses the zone pair's average for that hour, then for the neighbouring hours,
+        then for all hours, and finally straight-line distance at the default speed.
+        """
+        from_zone = self.zone_of(from_lat, from_lon)
+        to_zone = self.zone_of(to_lat, to_lon)
+        if from_zone is not None and to_zone is not None:
+            hour = (at or datetime.now()).hour
+            minutes = self.minutes[hour, from_zone, to_zone]
+            if not np.isnan(minutes):
+                return float(minutes)
+
+            neighbours = self.minutes[[(hour - 1) % 24, (hour + 1) % 24], from_zone, to_zone]
+            neighbours = neighbours[~np.isnan(neighbours)]
+            if neighbours.size:
+                return float(neighbours.mean())
+
+            minutes = self.all_hours_minutes[from_zone, to_zone]
+            if not np.isnan(minutes):
+                return float(minutes)
+
+        distance = haversine(from_lat, from_lon, to_lat, to_lon)
+        return distance / self.default_speed_kmph * 60
+
+
+travel_time_matrix = TravelTimeMatrix()
@@ -1,9 +1,12 @@
 import socketio
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 import uvicorn
 from typing import List
+from urllib.parse import parse_qs
+import asyncio
 import random
 import math
 from utils import haversine  # Assumes haversine(lat1, lon1, lat2, lon2) is defined here
@@ -12,17 +15,27 @@ from sms_utils import send_sms
 from pymongo import MongoClient
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Literal, Optional, List
 from datetime import datetime
 from bson import ObjectId
 from fastapi import Body
 from bson.errors import InvalidId
+from archive import (
+    ARCHIVE_INTERVAL_MINUTES,
+    archive_finished_rides,
+    count_rides,
+    ensure_ride_indexes,
+    find_rides,
+)
+from ratelimit import concurrency_limiter, rate_limiter, rate_limit_stats, socket_client_address
+from eta import ETA_REFRESH_MINUTES, travel_time_matrix
 
 # === MongoDB Setup ===
 MONGO_URI = "mongodb://localhost:27017"  # Replace with your MongoDB URI
 client = MongoClient(MONGO_URI)
 db = client["car_booking_db"]
 rides_collection = db["rides"]
+rides_archive_collection = db["rides_archive"]  # Finished rides moved out of the live collection
 users_collection = db["users"]
 drivers_collection = db["drivers"]
 driver_status_collection = db["driver_status"]
@@ -33,6 +46,20 @@ sio = socketio.AsyncServer(cors_allowed_origins='*', async_mode='asgi')
 # Create FastAPI app
 app = FastAPI()
 
+# Admission control: global concurrency cap plus per-client and per-route token buckets.
+# Registered before CORS so rejected responses still carry CORS headers.
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    if not concurrency_limiter.try_acquire():
+        return JSONResponse(status_code=429, content={"detail": "Server busy, try again"}, headers={"Retry-After": "1"})
+    try:
+        client_host = request.client.host if request.client else "unknown"
+        if not await rate_limiter.allow_all([("client", client_host), (f"route:{request.url.path}", "")]):
+            return JSONResponse(status_code=429, content={"detail": "Too many requests"}, headers={"Retry-After": "1"})
+        return await call_next(request)
+    finally:
+        concurrency_limiter.release()
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -42,6 +69,53 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ----------------------------
+# Ride archival (hot/cold tiering)
+async def run_ride_archival():
+    """
+    Periodically move old finished rides into the archive collection so the
+    live rides collection only holds the working set.
+    """
+    while True:
+        try:
+            moved = await asyncio.to_thread(
+                archive_finished_rides, rides_collection, rides_archive_collection
+            )
+            if moved:
+                print(f"Archived {moved} finished rides")
+        except Exception as e:
+            print(f"Ride archival error: {str(e)}")
+        await asyncio.sleep(ARCHIVE_INTERVAL_MINUTES * 60)
+
+@app.on_event("startup")
+async def start_ride_archival():
+    try:
+        ensure_ride_indexes(rides_collection, rides_archive_collection)
+    except Exception as e:
+        print(f"Index creation error: {str(e)}")
+    asyncio.create_task(run_ride_archival())
+
+# ----------------------------
+# Travel-time table refresh
+async def run_eta_refresh():
+    """
+    Periodically add newly completed rides to the zone-to-zone travel-time table
+    """
+    while True:
+        try:
+            added = await asyncio.to_thread(
+                travel_time_matrix.refresh, rides_collection, rides_archive_collection
+            )
+            if added:
+                print(f"Added {added} trips to the travel-time table")
+        except Exception as e:
+            print(f"Travel-time refresh error: {str(e)}")
+        await asyncio.sleep(ETA_REFRESH_MINUTES * 60)
+
+@app.on_event("startup")
+async def start_eta_refresh():
+    asyncio.create_task(run_eta_refresh())
+
 # ----------------------------
 # Base driver data (without fixed locations)
 base_drivers = [
@@ -93,6 +167,21 @@ def generate_drivers_near_location(lat, lon, num_drivers=3, radius_km=2.0):
     
     return drivers
 
+def add_driver_etas(drivers, lat, lon):
+    """
+    Add the estimated minutes for each driver to reach the pickup location
+    """
+    for driver in drivers:
+        driver_lat, driver_lon = driver["location"]
+        eta = travel_time_matrix.eta_minutes(driver_lat, driver_lon, lat, lon)
+        driver["eta_minutes"] = round(eta, 1)
+    return drivers
+
+def driver_rank_key(rank_by):
+    if rank_by == "eta":
+        return lambda driver: driver["eta_minutes"]
+    return lambda driver: driver["distance_from_pickup"]
+
 # ----------------------------
 # Pydantic models
 class RideRequest(BaseModel):
@@ -107,12 +196,14 @@ class FareRequest(BaseModel):
 class LocationRequest(BaseModel):
     lat: float
     lon: float
+    rank_by: Literal["distance", "eta"] = "distance"
 
 class DriverSearchRequest(BaseModel):
     pickup_lat: float
     pickup_lon: float
     radius_km: float = 2.0  # Default 2km radius
     num_drivers: int = 3    # Default 3 drivers
+    rank_by: Literal["distance", "eta"] = "distance"
 
 class SMSRequest(BaseModel):
     phone: str
@@ -156,6 +247,7 @@ class RideRequest(BaseModel):
     drop: str
     pickup_coords: List[float]
     rider_email: str
+    drop_coords: Optional[List[float]] = None  # [lat, lon], enables ETA learning
 
 class DriverCancelRideRequest(BaseModel):
     ride_id: str
@@ -169,8 +261,11 @@ class DriverCancelRideRequest(BaseModel):
 async def book_ride(ride: RideRequest):
     try:
         lat1, lon1 = ride.pickup_coords
-        # Hardcode or fetch drop coords here; for now, assume dummy:
-        lat2, lon2 = lat1 + 0.05, lon1 + 0.05  # Temporary
+        if ride.drop_coords:
+            lat2, lon2 = ride.drop_coords
+        else:
+            # Hardcode or fetch drop coords here; for now, assume dummy:
+            lat2, lon2 = lat1 + 0.05, lon1 + 0.05  # Temporary
         
         distance = haversine(lat1, lon1, lat2, lon2)
         fare = 50 + (distance * 10)
@@ -187,6 +282,9 @@ async def book_ride(ride: RideRequest):
             "status": "booked",
             "ride_time": datetime.now().isoformat()
         }
+        # Only real drop coordinates are stored so the travel-time table learns from actual trips
+        if ride.drop_coords:
+            ride_data["drop_coords"] = ride.drop_coords
 
         rides_collection.insert_one(ride_data)
         return {"message": "Ride booked successfully"}
@@ -216,31 +314,38 @@ def calculate_fare(data: FareRequest):
     fare = 50 + (distance * 10)  # ₹50 base fare + ₹10/km
     return {"distance": distance, "fare": round(fare, 2)}
 
+@app.post("/estimate-eta")
+def estimate_eta(data: FareRequest):
+    """
+    Estimated trip time between pickup and drop from the travel-time table
+    """
+    lat1, lon1 = data.pickup
+    lat2, lon2 = data.drop
+    eta = travel_time_matrix.eta_minutes(lat1, lon1, lat2, lon2)
+    return {"eta_minutes": round(eta, 1)}
+
 @app.post("/match-driver")
 async def match_driver(location: LocationRequest):
     """
-    Find the nearest driver from dynamically generated drivers near pickup location
+    Find the best driver (nearest or quickest to arrive) from dynamically generated drivers near pickup location
     """
     user_lat = location.lat
     user_lon = location.lon
+    rank_key = driver_rank_key(location.rank_by)
     
     # Generate drivers near the pickup location
     nearby_drivers = generate_drivers_near_location(user_lat, user_lon)
+    add_driver_etas(nearby_drivers, user_lat, user_lon)
     
-    # Find the nearest driver
-    nearest_driver = None
-    min_distance = float("inf")
-    
-    for driver in nearby_drivers:
-        driver_lat, driver_lon = driver["location"]
-        distance = haversine(user_lat, user_lon, driver_lat, driver_lon)
-        if distance < min_distance:
-            min_distance = distance
-            nearest_driver = driver
+    # Find the best driver
+    best_driver = min(nearby_drivers, key=rank_key)
+    driver_lat, driver_lon = best_driver["location"]
+    distance = haversine(user_lat, user_lon, driver_lat, driver_lon)
     
     return {
-        "driver": nearest_driver,
-        "distance_km": round(min_distance, 2),
+        "driver": best_driver,
+        "distance_km": round(distance, 2),
+        "eta_minutes": best_driver["eta_minutes"],
         "all_nearby_drivers": nearby_drivers
     }
 
@@ -249,19 +354,22 @@ async def find_drivers(request: DriverSearchRequest):
     """
     Get all available drivers near the pickup location
     """
+    rank_key = driver_rank_key(request.rank_by)
     drivers = generate_drivers_near_location(
         request.pickup_lat, 
         request.pickup_lon, 
         request.num_drivers, 
         request.radius_km
     )
+    add_driver_etas(drivers, request.pickup_lat, request.pickup_lon)
     
-    # Sort drivers by distance from pickup
-    drivers.sort(key=lambda x: x["distance_from_pickup"])
+    # Sort drivers by distance or ETA to pickup
+    drivers.sort(key=rank_key)
     
     return {
         "pickup_location": [request.pickup_lat, request.pickup_lon],
         "search_radius_km": request.radius_km,
+        "ranked_by": request.rank_by,
         "drivers_found": len(drivers),
         "drivers": drivers
     }
@@ -300,7 +408,7 @@ def create_ride(ride: Ride):
 # === Get All Rides for a Specific Rider ===
 @app.get("/rides/user/{email}")
 def get_rides_for_user(email: str):
-    rides = list(rides_collection.find({"rider_email": email}))
+    rides = find_rides(rides_collection, rides_archive_collection, {"rider_email": email})
     for ride in rides:
         ride["_id"] = str(ride["_id"])
     return rides
@@ -308,7 +416,7 @@ def get_rides_for_user(email: str):
 # === Get All Rides (Admin use) ===
 @app.get("/rides")
 def get_all_rides():
-    rides = list(rides_collection.find())
+    rides = find_rides(rides_collection, rides_archive_collection, {})
     for ride in rides:
         ride["_id"] = str(ride["_id"])
     return rides
@@ -365,10 +473,11 @@ def get_user(email: str):
 def rate_ride(ride_id: str, rating: int = Body(..., embed=True)):
     if rating < 1 or rating > 5:
         return {"error": "Rating must be between 1 and 5"}
-    result = rides_collection.update_one(
-        {"_id": ObjectId(ride_id), "status": "completed"},
-        {"$set": {"rating": rating}}
-    )
+    ride_filter = {"_id": ObjectId(ride_id), "status": "completed"}
+    result = rides_collection.update_one(ride_filter, {"$set": {"rating": rating}})
+    if result.matched_count == 0:
+        # The ride may already have been moved to the archive
+        result = rides_archive_collection.update_one(ride_filter, {"$set": {"rating": rating}})
     if result.modified_count == 1:
         return {"message": "Rating submitted successfully"}
     return {"error": "Ride not found or not completed yet"}
@@ -393,7 +502,8 @@ def available_rides():
 # 2. GET: Driver's assigned rides
 @app.get("/driver/my-rides/{driver_email}")
 def my_rides(driver_email: str):
-    rides = list(rides_collection.find({"driver_id": driver_email}))
+    # Includes archived rides, the driver dashboard shows completed rides as history
+    rides = find_rides(rides_collection, rides_archive_collection, {"driver_id": driver_email})
     for ride in rides:
         ride["_id"] = str(ride["_id"])
     return rides
@@ -401,10 +511,10 @@ def my_rides(driver_email: str):
 # 3. GET: Driver's earnings summary
 @app.get("/driver/earnings/{driver_email}")
 def driver_earnings(driver_email: str):
-    completed_rides = list(rides_collection.find({
+    completed_rides = find_rides(rides_collection, rides_archive_collection, {
         "driver_id": driver_email,
         "status": "completed"
-    }))
+    })
     total_earnings = sum(ride.get("fare", 0) for ride in completed_rides)
     total_rides = len(completed_rides)
     return {
@@ -439,10 +549,34 @@ def accept_ride(action: RideAction):
 
     rides_collection.update_one(
         {"_id": ObjectId(action.ride_id)},
-        {"$set": {"driver_id": action.driver_email, "status": "ongoing"}}
+        {"$set": {"driver_id": action.driver_email, "status": "ongoing", "accepted_at": datetime.utcnow()}}
     )
     return {"message": "Ride accepted"}
 
+# 5a. POST: Start a ride (rider picked up)
+@app.post("/driver/start-ride")
+def start_ride(action: RideAction):
+    try:
+        ride = rides_collection.find_one({"_id": ObjectId(action.ride_id)})
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid Ride ID format")
+
+    if not ride:
+        raise HTTPException(status_code=404, detail="Ride not found")
+
+    if ride.get("status") != "ongoing":
+        raise HTTPException(status_code=400, detail="Ride not in progress")
+
+    if ride.get("picked_up_at"):
+        raise HTTPException(status_code=400, detail="Ride already started")
+
+    # Start of the actual trip, used to learn pickup-to-drop travel times
+    rides_collection.update_one(
+        {"_id": ObjectId(action.ride_id)},
+        {"$set": {"picked_up_at": datetime.utcnow()}}
+    )
+    return {"message": "Ride started"}
+
 # 6. POST: Complete a ride
 @app.post("/driver/complete-ride")
 def complete_ride(action: RideAction):
@@ -467,11 +601,11 @@ def complete_ride(action: RideAction):
 ##7.Driver Rating
 @app.get("/driver/{driver_id}/rating")
 def get_driver_rating(driver_id: str):
-    completed_rides = list(rides_collection.find({
+    completed_rides = find_rides(rides_collection, rides_archive_collection, {
         "driver_id": driver_id,
         "status": "completed",
         "rating": {"$ne": None}
-    }))
+    })
 
     if not completed_rides:
         return {"average_rating": 0.0, "total_rides": 0}
@@ -518,7 +652,7 @@ def get_admin_stats():
     total_users = users_collection.count_documents({})
     total_customers = users_collection.count_documents({"user_type": "customer"})
     total_drivers = users_collection.count_documents({"user_type": "driver"})
-    total_rides = rides_collection.count_documents({})
+    total_rides = count_rides(rides_collection, rides_archive_collection, {})
     active_rides = rides_collection.count_documents({"status": {"$in": ["booked", "ongoing"]}})
     return {
         "totalUsers": total_users,
@@ -541,7 +675,7 @@ def get_customers():
         # Fetch total fare from rides_collection using rider_email
         total_spent = sum(
             ride.get("fare", 0)
-            for ride in rides_collection.find({"rider_email": email, "status": "completed"})
+            for ride in find_rides(rides_collection, rides_archive_collection, {"rider_email": email, "status": "completed"})
         )
         customers.append({
             "email": email,
@@ -570,10 +704,10 @@ def get_all_drivers():
         email = driver["email"]
 
         # Completed rides for the driver
-        completed_rides = list(rides_collection.find({
+        completed_rides = find_rides(rides_collection, rides_archive_collection, {
             "driver_id": email,
             "status": "completed"
-        }))
+        })
 
         # Total earnings
         earnings = sum(ride.get("fare", 0) for ride in completed_rides)
@@ -610,25 +744,81 @@ def toggle_user_status(email: str):
     users_collection.update_one({"email": email}, {"$set": {"status": new_status}})
     return {"email": email, "new_status": new_status}
 
+@app.post("/admin/archive-rides")
+def archive_rides(max_age_days: Optional[int] = None):
+    """
+    Run the ride archival job immediately instead of waiting for the next cycle
+    """
+    moved = archive_finished_rides(rides_collection, rides_archive_collection, max_age_days)
+    return {"message": "Ride archival completed", "archived_rides": moved}
+
+@app.get("/admin/rate-limits")
+def get_rate_limits():
+    """
+    Configured limits with allowed/rejected counters for this worker
+    """
+    return rate_limit_stats()
+
 
 # ----------------------------
 # Socket.IO Events
 
 @sio.event
-async def connect(sid, environ):
+async def connect(sid, environ, auth=None):
+    # Bind the client address and driver identity to the connection once, so
+    # later events are limited on them rather than on what each frame claims
+    query = parse_qs(environ.get("QUERY_STRING", ""))
+    driver = (auth or {}).get("driver_email") or query.get("driver_email", [None])[0]
+    await sio.save_session(sid, {
+        "client": socket_client_address(environ),
+        "driver": driver,
+    })
     print(f"Client connected: {sid}")
 
 @sio.event
 async def locationUpdate(sid, data):
-    print(f"Location from {sid}: {data}")
-    await sio.emit("driverLocation", data)
+    session = await sio.get_session(sid)
+    driver = session.get("driver")
+    if driver and isinstance(data, dict):
+        claimed = data.get("driver_id") or data.get("driver_email")
+        if claimed and claimed != driver:
+            return  # Frame for a driver other than the one bound to this connection
+
+    # A newer frame supersedes this one, so frames over the limit are dropped instead of queued
+    if not concurrency_limiter.try_acquire():
+        return
+    try:
+        if not await rate_limiter.allow_all([
+            ("socket_client", session.get("client")),
+            ("socket", sid),
+            ("driver", driver or sid),
+            ("route:locationUpdate", ""),
+        ]):
+            return
+
+        print(f"Location from {sid}: {data}")
+        await sio.emit("driverLocation", data)
+    finally:
+        concurrency_limiter.release()
 
 @sio.event
 async def requestDrivers(sid, data):
     """
     Socket event to request drivers near a location
     """
+    if not concurrency_limiter.try_acquire():
+        await sio.emit("error", {"message": "Server busy, try again"}, room=sid)
+        return
     try:
+        session = await sio.get_session(sid)
+        if not await rate_limiter.allow_all([
+            ("socket_client", session.get("client")),
+            ("socket", sid),
+            ("route:requestDrivers", ""),
+        ]):
+            await sio.emit("error", {"message": "Too many requests"}, room=sid)
+            return
+
         lat = data.get('lat')
         lon = data.get('lon')
         radius = data.get('radius', 2.0)
@@ -647,6 +837,8 @@ async def requestDrivers(sid, data):
         
     except Exception as e:
         await sio.emit("error", {"message": str(e)}, room=sid)
+    finally:
+        concurrency_limiter.release()
 
 @sio.event
 async def disconnect(sid):
@@ -0,0 +1,243 @@
+# ratelimit.py
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _limit_from_env(name, rate, burst):
+    """
+    Read a (rate per second, burst) pair from <name>_RATE and <name>_BURST
+    """
+    return (
+        float(os.getenv(f"{name}_RATE", rate)),
+        float(os.getenv(f"{name}_BURST", burst)),
+    )
+
+
+# "memory" works within one process, "redis" shares buckets between workers
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Seconds to wait for Redis before letting the request through
+REDIS_TIMEOUT = float(os.getenv("RATE_LIMIT_REDIS_TIMEOUT", "0.1"))
+# Requests/events handled at once before new ones are shed
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "200"))
+
+# Limits are (tokens added per second, bucket size)
+RATE_LIMITS = {
+    # Every REST request, per client IP
+    "client": _limit_from_env("RATE_LIMIT_CLIENT", 20, 40),
+    # Every Socket.IO event, per connection
+    "socket": _limit_from_env("RATE_LIMIT_SOCKET", 10, 20),
+    # Every Socket.IO event, per client address (survives reconnects)
+    "socket_client": _limit_from_env("RATE_LIMIT_SOCKET_CLIENT", 20, 40),
+    # locationUpdate frames, per driver
+    "driver": _limit_from_env("RATE_LIMIT_DRIVER", 1, 3),
+    # Hot routes and events, shared by all clients
+    "route:/calculate-fare": _limit_from_env("RATE_LIMIT_CALCULATE_FARE", 200, 400),
+    "route:/match-driver": _limit_from_env("RATE_LIMIT_MATCH_DRIVER", 100, 200),
+    "route:/find-drivers": _limit_from_env("RATE_LIMIT_FIND_DRIVERS", 100, 200),
+    "route:/book-ride": _limit_from_env("RATE_LIMIT_BOOK_RIDE", 50, 100),
+    "route:/estimate-eta": _limit_from_env("RATE_LIMIT_ESTIMATE_ETA", 200, 400),
+    "route:locationUpdate": _limit_from_env("RATE_LIMIT_LOCATION_UPDATE", 500, 1000),
+    "route:requestDrivers": _limit_from_env("RATE_LIMIT_REQUEST_DRIVERS", 100, 200),
+}
+
+
+def validate_limits(limits):
+    """
+    Fail at startup on limits that cannot work, instead of on every request
+    """
+    for name, (rate, burst) in limits.items():
+        if rate <= 0:
+            raise ValueError(f"Rate limit '{name}': rate must be greater than 0, got {rate}")
+        if burst < 1:
+            raise ValueError(f"Rate limit '{name}': burst must be at least 1, got {burst}")
+
+
+class InMemoryBackend:
+    """
+    Token buckets held in a dict, only valid within a single process
+    """
+
+    def __init__(self, max_buckets=100000):
+        self.buckets = {}  # key -> [tokens, last_refill, seconds_to_refill]
+        self.max_buckets = max_buckets
+
+    async def consume(self, key, rate, burst, cost=1):
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.max_buckets:
+                self._prune(now)
+            bucket = self.buckets[key] = [burst, now, burst / rate]
+
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        bucket[0], bucket[1] = tokens, now
+        return allowed
+
+    def _prune(self, now):
+        # A bucket untouched for longer than it takes to refill is full again,
+        # so dropping it does not change any decision
+        self.buckets = {
+            key: bucket for key, bucket in self.buckets.items()
+            if now - bucket[1] < bucket[2]
+        }
+
+
+class RedisBackend:
+    """
+    Token buckets stored in Redis so every worker shares the same limits.
+    Uses the asyncio client so a Redis round-trip never blocks the event loop.
+    """
+
+    # Log Redis failures at most this often
+    ERROR_LOG_INTERVAL = 60
+
+    SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local cost = tonumber(ARGV[3])
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(bucket[1]) or burst
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + (now - updated) * rate)
+    local allowed = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return allowed
+    """
+
+    def __init__(self, url, prefix="ratelimit:", timeout=None):
+        import redis.asyncio  # Only needed when the shared backend is enabled
+
+        timeout = REDIS_TIMEOUT if timeout is None else timeout
+        self.client = redis.asyncio.Redis.from_url(
+            url, socket_timeout=timeout, socket_connect_timeout=timeout
+        )
+        self.prefix = prefix
+        self.script = self.client.register_script(self.SCRIPT)
+        self.errors = 0
+        self.last_error_log = None
+
+    async def consume(self, key, rate, burst, cost=1):
+        try:
+            return bool(await self.script(keys=[self.prefix + key], args=[rate, burst, cost]))
+        except Exception as e:
+            # Fail open, an unreachable Redis should not take the API down
+            self.errors += 1
+            now = time.monotonic()
+            if self.last_error_log is None or now - self.last_error_log >= self.ERROR_LOG_INTERVAL:
+                print(f"Rate limit backend error ({self.errors} so far): {str(e)}")
+                self.last_error_log = now
+            return True
+
+
+class RateLimiter:
+    """
+    Checks requests against the configured token buckets and keeps
+    allowed/rejected counters per limit (counters are per process)
+    """
+
+    def __init__(self, backend, limits):
+        validate_limits(limits)
+        self.backend = backend
+        self.limits = limits
+        self.counters = {name: {"allowed": 0, "rejected": 0} for name in limits}
+
+    async def allow(self, name, key=""):
+        """
+        Take one token from the bucket `name` for `key`.
+        Limits that are not configured always allow.
+        """
+        limit = self.limits.get(name)
+        if limit is None:
+            return True
+        rate, burst = limit
+        allowed = await self.backend.consume(f"{name}:{key}", rate, burst)
+        self.counters[name]["allowed" if allowed else "rejected"] += 1
+        return allowed
+
+    async def allow_all(self, checks):
+        """
+        Check a list of (name, key) limits, stopping at the first rejection
+        """
+        for name, key in checks:
+            if not await self.allow(name, key):
+                return False
+        return True
+
+
+class ConcurrencyLimiter:
+    """
+    Global cap on in-flight work; anything over the cap is shed
+    """
+
+    def __init__(self, max_concurrent):
+        if max_concurrent < 1:
+            raise ValueError(f"MAX_CONCURRENT_REQUESTS must be at least 1, got {max_concurrent}")
+        self.max_concurrent = max_concurrent
+        self.in_flight = 0
+        self.shed = 0
+
+    def try_acquire(self):
+        if self.in_flight >= self.max_concurrent:
+            self.shed += 1
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+
+def create_rate_limiter():
+    if RATE_LIMIT_BACKEND == "redis":
+        backend = RedisBackend(REDIS_URL)
+    else:
+        backend = InMemoryBackend()
+    return RateLimiter(backend, RATE_LIMITS)
+
+
+rate_limiter = create_rate_limiter()
+concurrency_limiter = ConcurrencyLimiter(MAX_CONCURRENT_REQUESTS)
+
+
+def rate_limit_stats():
+    stats = {
+        "backend": RATE_LIMIT_BACKEND,
+        "limits": {
+            name: {"rate_per_sec": rate, "burst": burst}
+            for name, (rate, burst) in rate_limiter.limits.items()
+        },
+        "counters": rate_limiter.counters,
+        "concurrency": {
+            "max_concurrent": concurrency_limiter.max_concurrent,
+            "in_flight": concurrency_limiter.in_flight,
+            "shed": concurrency_limiter.shed,
+        },
+    }
+    if isinstance(rate_limiter.backend, RedisBackend):
+        stats["backend_errors"] = rate_limiter.backend.errors
+    return stats
+
+
+def socket_client_address(environ):
+    """
+    Remote address of a Socket.IO connection. Under ASGI, REMOTE_ADDR is a
+    placeholder, so the address is read from the ASGI scope when available.
+    """
+    client = environ.get("asgi.scope", {}).get("client")
+    if client:
+        return client[0]
+    return environ.get("REMOTE_ADDR", "unknown")
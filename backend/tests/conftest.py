@@ -0,0 +1,17 @@
+import os
+import sys
+
+import mongomock
+import pytest
+
+# Backend modules are imported by name, the same way main.py imports them
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def collections():
+    """
+    Live and archived rides collections in a throwaway in-memory database
+    """
+    db = mongomock.MongoClient()["car_booking_db"]
+    return db["rides"], db["rides_archive"]
@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from archive import PENDING_FIELD, archive_finished_rides, count_rides, find_rides, finished_before_query
+
+
+def old_ride(**fields):
+    ride = {
+        "rider_email": "rider@example.com",
+        "driver_id": "driver@example.com",
+        "status": "completed",
+        "fare": 100.0,
+        "rating": None,
+        "completed_at": datetime.utcnow() - timedelta(days=40),
+    }
+    ride.update(fields)
+    return ride
+
+
+def test_finished_before_query_matches_only_old_finished_rides(collections):
+    rides, _ = collections
+    cutoff = datetime.utcnow() - timedelta(days=30)
+    old = datetime.utcnow() - timedelta(days=40)
+    recent = datetime.utcnow() - timedelta(days=1)
+    rides.insert_many([
+        {"name": "old completed", "status": "completed", "completed_at": old},
+        {"name": "old cancelled", "status": "cancelled", "cancelled_at": old},
+        {"name": "old, ride_time only", "status": "completed", "ride_time": old.isoformat()},
+        {"name": "recent completed", "status": "completed", "completed_at": recent},
+        {"name": "recent, ride_time only", "status": "cancelled", "ride_time": recent.isoformat()},
+        {"name": "old but ongoing", "status": "ongoing", "ride_time": old.isoformat()},
+    ])
+
+    matched = {ride["name"] for ride in rides.find(finished_before_query(cutoff))}
+
+    assert matched == {"old completed", "old cancelled", "old, ride_time only"}
+
+
+def test_archive_moves_old_rides_in_batches(collections):
+    rides, archive = collections
+    rides.insert_many([old_ride() for _ in range(5)])
+    rides.insert_one(old_ride(status="ongoing"))
+
+    moved = archive_finished_rides(rides, archive, max_age_days=30, batch_size=2)
+
+    assert moved == 5
+    assert archive.count_documents({}) == 5
+    assert archive.count_documents({PENDING_FIELD: {"$exists": True}}) == 0
+    assert rides.count_documents({}) == 1
+
+
+def test_archive_overwrites_copies_left_by_interrupted_run(collections):
+    rides, archive = collections
+    ride_id = rides.insert_one(old_ride(rating=4)).inserted_id
+    archive.insert_one(old_ride(_id=ride_id))  # Stale copy, unrated
+
+    assert archive_finished_rides(rides, archive, max_age_days=30) == 1
+    assert archive.count_documents({}) == 1
+    assert archive.find_one({"_id": ride_id})["rating"] == 4
+    assert rides.count_documents({}) == 0
+
+
+class RateDuringCopy:
+    """
+    Archive collection that rates the ride right after it has been copied,
+    the way rate_ride can between the copy and the delete
+    """
+
+    def __init__(self, archive, rides):
+        self.archive = archive
+        self.rides = rides
+        self.rated = False
+
+    def __getattr__(self, name):
+        return getattr(self.archive, name)
+
+    def bulk_write(self, requests, ordered=True):
+        result = self.archive.bulk_write(requests, ordered=ordered)
+        if not self.rated:
+            self.rides.update_one({"status": "completed"}, {"$set": {"rating": 5}})
+            self.rated = True
+        return result
+
+
+@pytest.mark.parametrize("fields", [{}, {"rating": None}])
+def test_rating_survives_archival(collections, fields):
+    rides, archive = collections
+    ride = old_ride()
+    ride.pop("rating")
+    ride.update(fields)
+    ride_id = rides.insert_one(ride).inserted_id
+    racing_archive = RateDuringCopy(archive, rides)
+
+    # First pass copies the unrated ride, sees it changed and leaves it live
+    assert archive_finished_rides(rides, racing_archive, max_age_days=30) == 0
+    assert rides.find_one({"_id": ride_id})["rating"] == 5
+    assert len(find_rides(rides, archive, {"driver_id": "driver@example.com"})) == 1
+
+    # Next pass copies the rated ride over the stale copy
+    assert archive_finished_rides(rides, racing_archive, max_age_days=30) == 1
+    assert archive.find_one({"_id": ride_id})["rating"] == 5
+    assert rides.count_documents({}) == 0
+
+
+def test_find_and_count_read_both_tiers_once(collections):
+    rides, archive = collections
+    live_id = rides.insert_one(old_ride(fare=10.0)).inserted_id
+    archive.insert_one(old_ride(_id=live_id, fare=10.0, **{PENDING_FIELD: True}))  # Mid-archival copy
+    archive.insert_one(old_ride(fare=20.0))
+    query = {"driver_id": "driver@example.com", "status": "completed"}
+
+    found = find_rides(rides, archive, query)
+
+    assert sorted(ride["fare"] for ride in found) == [10.0, 20.0]
+    assert found[0]["_id"] == live_id
+    assert count_rides(rides, archive, query) == 2
+
+
+def test_copies_left_pending_by_interrupted_run_are_finished(collections):
+    rides, archive = collections
+    # Run stopped after deleting the live ride but before clearing the flag
+    archive.insert_one(old_ride(fare=30.0, **{PENDING_FIELD: True}))
+    query = {"driver_id": "driver@example.com"}
+    assert count_rides(rides, archive, query) == 0
+
+    assert archive_finished_rides(rides, archive, max_age_days=30) == 0
+
+    assert [ride["fare"] for ride in find_rides(rides, archive, query)] == [30.0]
+    assert count_rides(rides, archive, query) == 1
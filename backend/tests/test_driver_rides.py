@@ -0,0 +1,65 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture
+def client(collections, monkeypatch):
+    rides, archive = collections
+    monkeypatch.setattr(main, "rides_collection", rides)
+    monkeypatch.setattr(main, "rides_archive_collection", archive)
+    return TestClient(main.app)
+
+
+def start(client, ride_id):
+    return client.post("/driver/start-ride", json={"ride_id": str(ride_id), "driver_email": "driver@example.com"})
+
+
+def test_start_ride_records_pickup_time(client, collections):
+    rides, _ = collections
+    ride_id = rides.insert_one({"driver_id": "driver@example.com", "status": "ongoing"}).inserted_id
+
+    response = start(client, ride_id)
+
+    assert response.status_code == 200
+    assert isinstance(rides.find_one({"_id": ride_id})["picked_up_at"], datetime)
+
+
+def test_start_ride_only_once(client, collections):
+    rides, _ = collections
+    ride_id = rides.insert_one({"status": "ongoing", "picked_up_at": datetime.utcnow()}).inserted_id
+
+    response = start(client, ride_id)
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Ride already started"
+
+
+@pytest.mark.parametrize("status", ["booked", "completed", "cancelled"])
+def test_start_ride_requires_ongoing_ride(client, collections, status):
+    rides, _ = collections
+    ride_id = rides.insert_one({"status": status}).inserted_id
+
+    response = start(client, ride_id)
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Ride not in progress"
+    assert "picked_up_at" not in rides.find_one({"_id": ride_id})
+
+
+def test_start_ride_not_found(client):
+    assert start(client, ObjectId()).status_code == 404
+    assert start(client, "not-an-id").status_code == 400
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/match-driver", {"lat": 12.97, "lon": 77.59, "rank_by": "speed"}),
+    ("/find-drivers", {"pickup_lat": 12.97, "pickup_lon": 77.59, "rank_by": "speed"}),
+])
+def test_rank_by_is_validated(client, path, body):
+    assert client.post(path, json=body).status_code == 422
+    assert client.post(path, json={**body, "rank_by": "eta"}).status_code == 200
@@ -0,0 +1,164 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from eta import TravelTimeMatrix, trip_from_ride
+from utils import haversine
+
+BOUNDS = [12.80, 77.40, 13.20, 77.80]
+PICKUP = [12.96, 77.61]
+DROP = [13.01, 77.66]
+
+
+@pytest.fixture
+def matrix():
+    return TravelTimeMatrix(bounds=BOUNDS, zone_size=0.025, default_speed_kmph=25)
+
+
+def completed_ride(minutes, completed_at=None, **fields):
+    completed_at = completed_at or datetime.utcnow()
+    ride = {
+        "status": "completed",
+        "pickup_coords": PICKUP,
+        "drop_coords": DROP,
+        "picked_up_at": completed_at - timedelta(minutes=minutes),
+        "completed_at": completed_at,
+    }
+    ride.update(fields)
+    return ride
+
+
+def local_start_time(ride):
+    return trip_from_ride(ride)[4].astimezone().replace(tzinfo=None)
+
+
+def test_zone_of_bounds(matrix):
+    assert (matrix.rows, matrix.cols, matrix.num_zones) == (16, 16, 256)
+    assert matrix.zone_of(12.80, 77.40) == 0
+    assert matrix.zone_of(13.199, 77.799) == 255
+    assert matrix.zone_of(12.799, 77.5) is None
+    assert matrix.zone_of(13.21, 77.5) is None
+    assert matrix.zone_of(13.0, 77.81) is None
+
+
+def test_too_many_zones_fail_at_startup():
+    with pytest.raises(ValueError, match="ETA_MAX_ZONES"):
+        TravelTimeMatrix(bounds=BOUNDS, zone_size=0.01, max_zones=400)
+
+
+def test_trip_prefers_pickup_time_over_acceptance_and_booking():
+    completed_at = datetime.utcnow()
+    ride = completed_ride(
+        20,
+        completed_at=completed_at,
+        accepted_at=completed_at - timedelta(minutes=30),
+        ride_time=(datetime.now() - timedelta(minutes=40)).isoformat(),
+    )
+
+    start, end = trip_from_ride(ride)[4:]
+
+    assert end - start == timedelta(minutes=20)
+    assert trip_from_ride({"status": "completed", "pickup_coords": PICKUP}) is None
+
+
+def test_refresh_only_adds_rides_after_watermark(matrix, collections):
+    rides, archive = collections
+    first = datetime.utcnow().replace(microsecond=0) - timedelta(days=2)  # MongoDB keeps milliseconds
+    archive.insert_one(completed_ride(30, completed_at=first - timedelta(days=40)))
+    rides.insert_one(completed_ride(30, completed_at=first))
+
+    assert matrix.refresh(rides, archive) == 2
+    assert matrix.last_completed_at == first
+
+    # Nothing new: the same rides are not counted again, and the archive is not re-read
+    assert matrix.refresh(rides, archive) == 0
+    archive.insert_one(completed_ride(30, completed_at=first + timedelta(hours=1)))
+    assert matrix.refresh(rides, archive) == 0
+
+    rides.insert_one(completed_ride(30, completed_at=first + timedelta(hours=2)))
+    assert matrix.refresh(rides, archive) == 1
+    assert matrix.trips_loaded == 3
+
+
+def test_eta_uses_hour_then_neighbours_then_all_hours_then_distance(matrix, collections):
+    rides, _ = collections
+    ride = completed_ride(30, completed_at=datetime.utcnow().replace(microsecond=0))
+    rides.insert_one(ride)
+    matrix.refresh(rides)
+    learned_at = local_start_time(ride)
+
+    def eta_at(hours_later):
+        return matrix.eta_minutes(*PICKUP, *DROP, at=learned_at + timedelta(hours=hours_later))
+
+    assert eta_at(0) == pytest.approx(30)
+    assert eta_at(1) == pytest.approx(30)  # Neighbouring hour
+    assert eta_at(6) == pytest.approx(30)  # All-hours average for the pair
+
+    # A second trip in the neighbouring hour only affects that hour and the overall average
+    picked_up_next_hour = ride["picked_up_at"] + timedelta(hours=1)
+    rides.insert_one(completed_ride(10, completed_at=picked_up_next_hour + timedelta(minutes=10)))
+    matrix.refresh(rides)
+    assert eta_at(0) == pytest.approx(30)
+    assert eta_at(1) == pytest.approx(10)
+    assert eta_at(6) == pytest.approx(20)
+
+    # Unknown pair and points outside the grid use straight-line distance
+    straight_line = haversine(*DROP, *PICKUP) / 25 * 60
+    assert matrix.eta_minutes(*DROP, *PICKUP) == pytest.approx(straight_line)
+    assert matrix.eta_minutes(12.0, 77.0, 12.1, 77.1) == pytest.approx(haversine(12.0, 77.0, 12.1, 77.1) / 25 * 60)
+
+
+def test_implausible_trips_are_ignored(matrix):
+    now = datetime.utcnow()
+
+    assert not matrix.add_trip(*PICKUP, *DROP, now, now + timedelta(seconds=5))
+    assert not matrix.add_trip(*PICKUP, *DROP, now, now + timedelta(hours=5))
+    assert not matrix.add_trip(12.0, 77.0, *DROP, now, now + timedelta(minutes=20))
+    assert matrix.trips_loaded == 0
+
+
+def test_refresh_skips_malformed_rides_and_keeps_going(matrix, collections):
+    rides, archive = collections
+    completed_at = datetime.utcnow().replace(microsecond=0) - timedelta(hours=1)
+    trail_ms = [
+        {"lat": PICKUP[0], "lon": PICKUP[1], "timestamp": 1.76e12},
+        {"lat": DROP[0], "lon": DROP[1], "timestamp": 1.76e12 + 25 * 60 * 1000},
+    ]
+    rides.insert_many([
+        completed_ride(30, completed_at=completed_at - timedelta(minutes=5)),
+        completed_ride(30, completed_at=completed_at, gps_trail=trail_ms),  # JS milliseconds
+        completed_ride(30, completed_at=completed_at, gps_trail=[["north", "east", 1], ["x", "y", 2]]),
+        completed_ride(30, completed_at=completed_at, gps_trail={"start": 1, "end": 2}),
+        {**completed_ride(30), "completed_at": "yesterday"},
+    ])
+    archive.insert_one(completed_ride(30, completed_at=completed_at - timedelta(days=40)))
+
+    assert matrix.refresh(rides, archive) == 3  # Both good rides, the ms trail and the archived ride
+    assert matrix.rides_skipped == 2  # The dict trail raised, "yesterday" is not a datetime
+    assert matrix.last_completed_at == completed_at
+
+    rides.insert_one(completed_ride(30, completed_at=completed_at + timedelta(minutes=1)))
+    assert matrix.refresh(rides, archive) == 1
+
+
+def test_refresh_picks_up_completions_committed_late(matrix, collections):
+    rides, _ = collections
+    newest = datetime.utcnow().replace(microsecond=0)
+    rides.insert_one(completed_ride(30, completed_at=newest))
+    assert matrix.refresh(rides) == 1
+
+    # Completed (timestamp taken) before the watermark, but written after the refresh
+    rides.insert_one(completed_ride(30, completed_at=newest - timedelta(minutes=2)))
+
+    assert matrix.refresh(rides) == 1
+    assert matrix.refresh(rides) == 0  # Overlap re-reads are not counted twice
+    assert matrix.trips_loaded == 2
+
+
+def test_first_load_counts_a_ride_in_both_tiers_once(matrix, collections):
+    rides, archive = collections
+    ride = completed_ride(30, completed_at=datetime.utcnow().replace(microsecond=0))
+    ride_id = rides.insert_one(ride).inserted_id
+    archive.insert_one({**ride, "_id": ride_id})  # Archived between the two reads
+
+    assert matrix.refresh(rides, archive) == 1
@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+import ratelimit
+from ratelimit import (
+    ConcurrencyLimiter,
+    InMemoryBackend,
+    RateLimiter,
+    socket_client_address,
+    validate_limits,
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def consume(backend, key, rate, burst):
+    return asyncio.run(backend.consume(key, rate, burst))
+
+
+def test_bucket_rejects_after_burst_and_refills(clock):
+    backend = InMemoryBackend()
+
+    assert [consume(backend, "driver:d1", 1, 3) for _ in range(4)] == [True, True, True, False]
+
+    clock[0] += 1  # One token back
+    assert consume(backend, "driver:d1", 1, 3)
+    assert not consume(backend, "driver:d1", 1, 3)
+
+    clock[0] += 60  # Refill never goes above the burst
+    assert [consume(backend, "driver:d1", 1, 3) for _ in range(4)] == [True, True, True, False]
+
+
+def test_buckets_are_per_key(clock):
+    backend = InMemoryBackend()
+    for _ in range(3):
+        consume(backend, "driver:d1", 1, 3)
+
+    assert not consume(backend, "driver:d1", 1, 3)
+    assert consume(backend, "driver:d2", 1, 3)
+
+
+def test_prune_drops_only_refilled_buckets(clock):
+    backend = InMemoryBackend(max_buckets=2)
+    consume(backend, "fast", 100, 1)
+    consume(backend, "slow", 1, 10)
+    clock[0] += 1
+
+    consume(backend, "new", 1, 1)
+
+    assert sorted(backend.buckets) == ["new", "slow"]
+
+
+def test_rate_limiter_counts_and_stops_at_first_rejection(clock):
+    limiter = RateLimiter(InMemoryBackend(), {"client": (1, 1), "route:/x": (1, 5)})
+
+    assert asyncio.run(limiter.allow_all([("client", "1.2.3.4"), ("route:/x", "")]))
+    assert not asyncio.run(limiter.allow_all([("client", "1.2.3.4"), ("route:/x", "")]))
+    assert asyncio.run(limiter.allow("not-configured"))
+
+    assert limiter.counters == {
+        "client": {"allowed": 1, "rejected": 1},
+        "route:/x": {"allowed": 1, "rejected": 0},  # Not drained by the rejected client
+    }
+
+
+@pytest.mark.parametrize("limit", [(0, 10), (-1, 10), (1, 0)])
+def test_invalid_limits_fail_at_startup(limit):
+    with pytest.raises(ValueError):
+        validate_limits({"client": limit})
+
+
+@pytest.mark.parametrize("max_concurrent", [0, -5])
+def test_invalid_concurrency_cap_fails_at_startup(max_concurrent):
+    with pytest.raises(ValueError, match="MAX_CONCURRENT_REQUESTS"):
+        ConcurrencyLimiter(max_concurrent)
+
+
+def test_concurrency_limiter_sheds_over_cap():
+    limiter = ConcurrencyLimiter(2)
+
+    assert limiter.try_acquire()
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+    assert (limiter.in_flight, limiter.shed) == (2, 1)
+
+    limiter.release()
+    assert limiter.try_acquire()
+    assert (limiter.in_flight, limiter.shed) == (2, 1)
+
+
+def test_socket_client_address_prefers_asgi_scope():
+    environ = {"REMOTE_ADDR": "127.0.0.1", "asgi.scope": {"client": ("10.0.0.7", 51234)}}
+
+    assert socket_client_address(environ) == "10.0.0.7"
+    assert socket_client_address({"REMOTE_ADDR": "10.0.0.8"}) == "10.0.0.8"
+
+
+def test_redis_backend_fails_open_and_throttles_error_log(capsys):
+    pytest.importorskip("redis")
+    backend = ratelimit.RedisBackend("redis://127.0.0.1:1/0", timeout=0.05)
+
+    async def flood():
+        return [await backend.consume("client:1.2.3.4", 1, 1) for _ in range(3)]
+
+    assert asyncio.run(flood()) == [True, True, True]
+    assert backend.errors == 3
+    assert capsys.readouterr().out.count("Rate limit backend error") == 1
@@ -422,6 +422,7 @@ Ride Booking Team
         pickup: pickupQuery,
         drop: dropQuery,
         pickup_coords: pickupCoords,
+        drop_coords: dropCoords,
         rider_email
       });
       
@@ -121,6 +121,7 @@ function DriverDashboard({ user = { email: 'driver@example.com' } }) {
         customer_email: ride.rider_email,
         status: ride.status,
         created_at: ride.created_at,
+        picked_up_at: ride.picked_up_at,
         completed_at: ride.completed_at
       }));
       
@@ -246,6 +247,33 @@ function DriverDashboard({ user = { email: 'driver@example.com' } }) {
     }
   };
 
+  const startActiveRide = async () => {
+    if (!activeRide) return;
+
+    try {
+      const response = await fetch(`${API_BASE_URL}/driver/start-ride`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+          ride_id: activeRide.id,
+          driver_email: driverEmail
+        })
+      });
+
+      if (!response.ok) {
+        const errorData = await response.json();
+        throw new Error(errorData.detail || 'Failed to start ride');
+      }
+
+      setActiveRide({ ...activeRide, picked_up_at: new Date().toISOString() });
+    } catch (error) {
+      console.error('Error starting ride:', error);
+      alert('❌ Error starting ride: ' + error.message);
+    }
+  };
+
   const completeActiveRide = async () => {
     if (!activeRide) return;
 
@@ -413,6 +441,15 @@ function DriverDashboard({ user = { email: 'driver@example.com' } }) {
                   <span>❌</span>
                   Cancel
                 </button>
+                {!activeRide.picked_up_at && (
+                  <button
+                    onClick={startActiveRide}
+                    style={styles.startRideButton}
+                  >
+                    <span>🚦</span>
+                    Start Trip
+                  </button>
+                )}
                 <button
                   onClick={completeActiveRide}
                   style={styles.completeRideButton}
@@ -1150,6 +1187,23 @@ const styles = {
       transform: 'translateY(-2px)',
     },
   },
+  startRideButton: {
+    display: 'flex',
+    alignItems: 'center',
+    gap: '8px',
+    padding: '12px 20px',
+    backgroundColor: '#3b82f6',
+    color: 'white',
+    border: 'none',
+    borderRadius: '12px',
+    cursor: 'pointer',
+    fontWeight: '500',
+    transition: 'all 0.3s ease',
+    '&:hover': {
+      backgroundColor: '#2563eb',
+      transform: 'translateY(-2px)',
+    },
+  },
   completeRideButton: {
     display: 'flex',
     alignItems: 'center',